@@ -1,78 +1,153 @@
 import os
 import base64
 import io
-import shutil
-from flask import Flask, request, jsonify, render_template, send_file
-from werkzeug.utils import secure_filename
+import re
+import uuid
+import threading
+from flask import Flask, Request, request, jsonify, render_template, send_file
+from werkzeug.exceptions import ClientDisconnected, HTTPException, RequestEntityTooLarge
 import google.generativeai as genai
-from PIL import Image
+from cachetools import TTLCache
+from PIL import Image, UnidentifiedImageError
 from config import (
-    GEMINI_API_KEY, GEMINI_MODEL, GEMINI_IMAGE_MODEL, MAX_FILE_SIZE,
-    ALLOWED_EXTENSIONS, UPLOAD_FOLDER, allowed_file
+    GEMINI_API_KEY, GEMINI_MODEL, GEMINI_IMAGE_MODEL, GEMINI_MAX_IMAGE_SIZE, MAX_FILE_SIZE,
+    ALLOWED_EXTENSIONS, ALLOWED_IMAGE_FORMATS, UPLOAD_CHUNK_SIZE, MAX_FORM_FIELD_SIZE, MAX_FORM_PARTS,
+    PENDING_UPLOADS_MAX, PENDING_UPLOAD_TTL,
+    ANALYSIS_PROMPT, PROMPT_VERSION, ISOMETRIC_PROMPT, ISOMETRIC_PROMPT_VERSION, allowed_file
 )
+import response_cache
+import tasks
+
+class UploadRequest(Request):
+    """
+    Request with small multipart limits so padded uploads are rejected while parsing
+    File parts are spooled rather than held in memory, so the field limit mainly
+    bounds text fields, which no route reads
+    """
+    max_form_memory_size = MAX_FORM_FIELD_SIZE
+    max_form_parts = MAX_FORM_PARTS
 
 app = Flask(__name__)
+app.request_class = UploadRequest
+# Oversize bodies are rejected from Content-Length before parsing and handled by the 413 handler
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # Configure Gemini API
 genai.configure(api_key=GEMINI_API_KEY)
 
-def analyze_floor_plan(image_path):
-    """
-    Analyze floor plan image using Gemini VLM API
-    Returns formatted bullet-point feedback
-    """
-    model = genai.GenerativeModel(GEMINI_MODEL)
-    
-    # Read image file
-    with open(image_path, 'rb') as image_file:
-        image_data = image_file.read()
-    
-    # Craft concise prompt for floor plan analysis
-    prompt = """Analyze this floor plan and provide CRISP, CONCISE bullet-point feedback. Keep each point to ONE line maximum. Be direct and actionable.
+# Models are built once and shared by all requests
+TEXT_MODEL = genai.GenerativeModel(GEMINI_MODEL)
+if GEMINI_IMAGE_MODEL == GEMINI_MODEL:
+    IMAGE_MODEL = TEXT_MODEL
+else:
+    try:
+        IMAGE_MODEL = genai.GenerativeModel(GEMINI_IMAGE_MODEL)
+    except Exception as e:
+        print(f"Image model '{GEMINI_IMAGE_MODEL}' could not be created, using '{GEMINI_MODEL}' instead: {e}")
+        IMAGE_MODEL = TEXT_MODEL
+
+# Cache namespaces - changing the model or prompt starts a fresh set of entries
+ANALYSIS_CACHE_NAMESPACE = f"{GEMINI_MODEL}-{PROMPT_VERSION}"
+VIEW_3D_CACHE_NAMESPACE = f"{GEMINI_IMAGE_MODEL}-{ISOMETRIC_PROMPT_VERSION}"
 
-Focus on these three areas:
+# Expired cache entries are deleted in the background
+response_cache.start_janitor()
 
-**Accessibility (ADA Compliance):**
-- Door widths (min 32"), clearances, wheelchair routes, ramps, bathroom accessibility
+# Downscaled uploads (PNG bytes, cache key) waiting for an optional /generate_3d call, keyed by temp id
+# Re-encoded rather than kept decoded - line drawings compress ~100x, so this keeps the cache small
+# In-process only - a multi-process deployment would need a shared store such as Redis
+PENDING_UPLOADS = TTLCache(maxsize=PENDING_UPLOADS_MAX, ttl=PENDING_UPLOAD_TTL)
+PENDING_UPLOADS_LOCK = threading.Lock()
 
-**Space Efficiency:**
-- Room proportions, wasted space, layout optimization, traffic flow, storage
+# Gemini error categories, all matched in a single pass over the error message
+ERROR_RE = re.compile(
+    r'(?P<auth>api key|authentication|401|403)'
+    r'|(?P<quota>quota|rate limit|429)'
+    r'|(?P<safety>safety)'
+    r'|(?P<missing>not found|does not exist|not available|invalid)'
+    r'|(?P<model>model)',
+    re.IGNORECASE
+)
 
-**Best Practices:**
-- Room flow, natural light, privacy, functionality
+# Errors raised by analyze_floor_plan for each category, in priority order
+ANALYSIS_ERRORS = {
+    'auth': lambda error_msg: Exception(f"Gemini API authentication failed. Please check your API key. Error: {error_msg}"),
+    'quota': lambda error_msg: Exception("Gemini API quota exceeded. Please try again later."),
+    'safety': lambda error_msg: Exception("Content was blocked by safety filters. Please try a different image."),
+}
 
-IMPORTANT:
-- Maximum 3-5 bullet points per category
-- Each bullet = ONE short sentence (10-15 words max)
-- Skip obvious/good features - only mention issues or improvements
-- Use format: "• Issue: brief solution"
-- Be direct, no explanations or context"""
+def _error_kinds(error_msg):
+    """Return the set of ERROR_RE categories mentioned in an error message"""
+    return {match.lastgroup for match in ERROR_RE.finditer(error_msg)}
 
+def _prepare_for_gemini(img):
+    """
+    Return an RGB copy of img no larger than GEMINI_MAX_IMAGE_SIZE on either side
+    Gemini tiles images internally, so larger inputs only add tokens and upload time
+    """
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        # Flatten transparency onto white so line drawings don't end up on black
+        rgba = img.convert('RGBA')
+        prepared = Image.new('RGB', rgba.size, (255, 255, 255))
+        prepared.paste(rgba, mask=rgba.getchannel('A'))
+    else:
+        prepared = img.convert('RGB')
+    
+    prepared.thumbnail((GEMINI_MAX_IMAGE_SIZE, GEMINI_MAX_IMAGE_SIZE), Image.LANCZOS)
+    return prepared
+
+def analyze_floor_plan(img, image_key):
+    """
+    Analyze floor plan image using Gemini VLM API
+    Takes the image as returned by _prepare_for_gemini and the response_cache.image_hash of the upload
+    Returns formatted bullet-point feedback
+    Repeat uploads of the same image are served from the response cache
+    """
+    cached = response_cache.load('analyze', ANALYSIS_CACHE_NAMESPACE, image_key, 'txt')
+    if cached is not None:
+        return cached.decode('utf-8')
+    
+    # Near-duplicates (resaved, recompressed, lightly cropped) reuse an earlier response
+    hashes = response_cache.perceptual_hashes(img)
+    similar = response_cache.find_similar(ANALYSIS_CACHE_NAMESPACE, hashes)
+    if similar is not None:
+        return similar
+    
     try:
-        # Load image using PIL
-        img = Image.open(image_path)
-        
         # Generate content with image
-        response = model.generate_content([prompt, img])
+        response = TEXT_MODEL.generate_content([ANALYSIS_PROMPT, img])
         
         if not response or not response.text:
             raise Exception("Empty response from Gemini API")
         
+        response_cache.store('analyze', ANALYSIS_CACHE_NAMESPACE, image_key, 'txt', response.text.encode('utf-8'))
+        response_cache.remember_similar(ANALYSIS_CACHE_NAMESPACE, hashes, image_key, response.text)
         return response.text
     except Exception as e:
         error_msg = str(e)
-        if "API key" in error_msg or "authentication" in error_msg.lower() or "401" in error_msg or "403" in error_msg:
-            raise Exception(f"Gemini API authentication failed. Please check your API key. Error: {error_msg}")
-        elif "quota" in error_msg.lower() or "rate limit" in error_msg.lower():
-            raise Exception("Gemini API quota exceeded. Please try again later.")
-        elif "safety" in error_msg.lower():
-            raise Exception("Content was blocked by safety filters. Please try a different image.")
-        else:
-            raise Exception(f"Gemini API error: {error_msg}")
+        kinds = _error_kinds(error_msg)
+        # ANALYSIS_ERRORS is ordered by priority
+        kind = next((kind for kind in ANALYSIS_ERRORS if kind in kinds), None)
+        if kind:
+            raise ANALYSIS_ERRORS[kind](error_msg)
+        raise Exception(f"Gemini API error: {error_msg}")
+
+def generate_3d_view_from_plan(img, image_key):
+    """
+    Generate a 3D isometric view, serving repeat uploads from the response cache
+    Takes the image as returned by _prepare_for_gemini and the response_cache.image_hash of the upload
+    Returns (BytesIO of PNG data, mime type)
+    """
+    cached = response_cache.load('3d', VIEW_3D_CACHE_NAMESPACE, image_key, 'png')
+    if cached is not None:
+        return io.BytesIO(cached), 'image/png'
+    
+    img_bytes, mime_type, cacheable = _render_3d_view(img)
+    if cacheable:
+        response_cache.store('3d', VIEW_3D_CACHE_NAMESPACE, image_key, 'png', img_bytes.getvalue())
+    return img_bytes, mime_type
 
-def generate_3d_view_from_plan(image_path):
+def _render_3d_view(img):
     """
     Generate a 3D isometric architectural view from floor plan
     
@@ -84,148 +159,30 @@ def generate_3d_view_from_plan(image_path):
     - Border highlights to simulate depth
     
     For true AI image generation, you would need Google's Imagen API or similar services.
-    """
-    img = Image.open(image_path)
-    
-    # Create a prompt for generating 3D isometric view
-    prompt = """create a 3d isometric model from this floor plan. 3d isometric model kept on a dark surface
-     at a 30 degree angle with studio lighting. studio lighting and soft shadows"""
     
+    Returns (BytesIO of PNG data, mime type, cacheable); error-path results are not cacheable
+    so a transient model error doesn't pin a plain copy of the plan for CACHE_TTL
+    """
     try:
-        # Try using the image generation model first (if it exists)
-        model = None
-        response = None
-        
-        try:
-            model = genai.GenerativeModel(GEMINI_IMAGE_MODEL)
-            response = model.generate_content([prompt, img])
-        except Exception as model_error:
-            # Log the actual error for debugging
-            error_str = str(model_error)
-            print(f"Error with image model '{GEMINI_IMAGE_MODEL}': {error_str}")
-            
-            # Check if it's a model not found error
-            error_lower = error_str.lower()
-            if any(term in error_lower for term in ["model", "not found", "does not exist", "invalid", "not available"]):
-                print(f"Image model '{GEMINI_IMAGE_MODEL}' not available, using standard model '{GEMINI_MODEL}'")
-                model = genai.GenerativeModel(GEMINI_MODEL)
-                # Standard Gemini models don't generate images, so we'll use text analysis
-                # and return an enhanced version of the original image
-                response = model.generate_content([prompt, img])
-            else:
-                # Re-raise the error with full details
-                raise Exception(f"Error accessing image generation model: {error_str}")
-        
-        # Check if response contains an image
-        if hasattr(response, 'candidates') and response.candidates:
-            for candidate in response.candidates:
-                if hasattr(candidate, 'content') and hasattr(candidate.content, 'parts'):
-                    for part in candidate.content.parts:
-                        if hasattr(part, 'inline_data') and part.inline_data:
-                            # Extract image data
-                            img_data = base64.b64decode(part.inline_data.data)
-                            img_3d = Image.open(io.BytesIO(img_data))
-                            
-                            # Save to bytes
-                            img_bytes = io.BytesIO()
-                            img_3d.save(img_bytes, format='PNG')
-                            img_bytes.seek(0)
-                            
-                            return img_bytes, 'image/png'
-        
-        # If no image in response, try using the model's image generation capability
-        # Some models return images differently - check for image data in response
-        if hasattr(response, 'parts'):
-            for part in response.parts:
-                if hasattr(part, 'inline_data') and part.inline_data:
-                    img_data = base64.b64decode(part.inline_data.data)
-                    img_3d = Image.open(io.BytesIO(img_data))
-                    img_bytes = io.BytesIO()
-                    img_3d.save(img_bytes, format='PNG')
-                    img_bytes.seek(0)
-                    return img_bytes, 'image/png'
+        img_bytes = _try_gemini_image(img, ISOMETRIC_PROMPT)
+        if img_bytes is not None:
+            return img_bytes, 'image/png', True
         
         # Fallback: Create enhanced visualization from original with 3D effects
         # Since Gemini doesn't generate images, we'll create a visual transformation
         print("No image generated by API, creating 3D transformation of original")
-        
-        # Convert to RGB if needed
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Create a 3D-like transformation
-        from PIL import ImageEnhance, ImageFilter, ImageOps, ImageDraw
-        import numpy as np
-        
-        width, height = img.size
-        
-        # Create enhanced version with better contrast and brightness
-        img_3d = img.copy()
-        
-        # Enhance contrast and brightness for better 3D effect
-        enhancer = ImageEnhance.Contrast(img_3d)
-        img_3d = enhancer.enhance(1.3)
-        
-        enhancer = ImageEnhance.Brightness(img_3d)
-        img_3d = enhancer.enhance(1.1)
-        
-        # Add sharpness
-        enhancer = ImageEnhance.Sharpness(img_3d)
-        img_3d = enhancer.enhance(1.2)
-        
-        # Create a shadow effect
-        shadow = img_3d.copy()
-        shadow = ImageOps.colorize(ImageOps.grayscale(shadow), black="#404040", white="#808080")
-        
-        # Create a new image with padding for shadow and dark background
-        padding = 30
-        new_width = width + padding * 2
-        new_height = height + padding * 2
-        result = Image.new('RGB', (new_width, new_height), color='#1a1a1a')  # Dark background
-        
-        # Paste shadow slightly offset to simulate depth
-        shadow_offset = 8
-        result.paste(shadow, (padding + shadow_offset, padding + shadow_offset))
-        
-        # Paste the main enhanced image
-        result.paste(img_3d, (padding, padding))
-        
-        # Add a 3D border effect
-        draw = ImageDraw.Draw(result)
-        
-        # Draw multiple borders for depth effect
-        for i in range(3):
-            border_color = f"#{hex(100 + i * 30)[2:]:0>2}" * 3  # Gradient border
-            draw.rectangle([
-                padding - i - 1, 
-                padding - i - 1, 
-                padding + width + i, 
-                padding + height + i
-            ], outline=border_color, width=1)
-        
-        # Add corner highlights for 3D effect
-        highlight_color = "#ffffff"
-        draw.line([padding, padding, padding + 20, padding], fill=highlight_color, width=2)
-        draw.line([padding, padding, padding, padding + 20], fill=highlight_color, width=2)
-        
-        # Save to bytes
-        img_bytes = io.BytesIO()
-        result.save(img_bytes, format='PNG')
-        img_bytes.seek(0)
-        
-        return img_bytes, 'image/png'
+        return _synthesize_fallback(img), 'image/png', True
         
     except Exception as e:
         error_msg = str(e)
-        error_lower = error_msg.lower()
+        kinds = _error_kinds(error_msg)
         
         # Check for model not found errors first
-        if "model" in error_lower and ("not found" in error_lower or "does not exist" in error_lower or "invalid" in error_lower):
+        if {'model', 'missing'} <= kinds:
             # Try falling back to the standard vision model
             try:
                 print(f"Image model not available, trying fallback to {GEMINI_MODEL}")
-                fallback_model = genai.GenerativeModel(GEMINI_MODEL)
-                response = fallback_model.generate_content([prompt, img])
+                TEXT_MODEL.generate_content([ISOMETRIC_PROMPT, img])
                 # Since standard Gemini models don't generate images, return enhanced original
                 img_3d = img.copy()
                 if img_3d.mode != 'RGB':
@@ -233,18 +190,168 @@ def generate_3d_view_from_plan(image_path):
                 img_bytes = io.BytesIO()
                 img_3d.save(img_bytes, format='PNG')
                 img_bytes.seek(0)
-                return img_bytes, 'image/png'
+                return img_bytes, 'image/png', False
             except Exception as fallback_error:
                 raise Exception(f"Image generation model unavailable. Error: {error_msg}. Fallback also failed: {str(fallback_error)}")
-        elif "API key" in error_msg or "authentication" in error_lower or "401" in error_msg or "403" in error_msg:
+        elif 'auth' in kinds:
             raise Exception(f"Gemini API authentication failed: {error_msg}")
-        elif "quota" in error_lower or "rate limit" in error_lower or "429" in error_msg:
+        elif 'quota' in kinds:
             # Show the actual error message for quota issues with more context
             raise Exception(f"Gemini API quota/rate limit error. Full error: {error_msg}. This might also indicate the model '{GEMINI_IMAGE_MODEL}' is not available. Please check your API key permissions and available models.")
         else:
             # Show the full error message for debugging
             raise Exception(f"3D generation error: {error_msg}. Model attempted: {GEMINI_IMAGE_MODEL}")
 
+def _try_gemini_image(img, prompt):
+    """
+    Ask Gemini for a 3D view of the floor plan
+    Returns a BytesIO of PNG data, or None if the response contained no image
+    """
+    # Try using the image generation model first (if it exists)
+    response = None
+    
+    try:
+        response = IMAGE_MODEL.generate_content([prompt, img])
+    except Exception as model_error:
+        # Log the actual error for debugging
+        error_str = str(model_error)
+        print(f"Error with image model '{GEMINI_IMAGE_MODEL}': {error_str}")
+        
+        # Check if it's a model not found error
+        if _error_kinds(error_str) & {'model', 'missing'}:
+            print(f"Image model '{GEMINI_IMAGE_MODEL}' not available, using standard model '{GEMINI_MODEL}'")
+            # Standard Gemini models don't generate images, so we'll use text analysis
+            # and return an enhanced version of the original image
+            response = TEXT_MODEL.generate_content([prompt, img])
+        else:
+            # Re-raise the error with full details
+            raise Exception(f"Error accessing image generation model: {error_str}")
+    
+    # Check if response contains an image
+    if hasattr(response, 'candidates') and response.candidates:
+        for candidate in response.candidates:
+            if hasattr(candidate, 'content') and hasattr(candidate.content, 'parts'):
+                for part in candidate.content.parts:
+                    if hasattr(part, 'inline_data') and part.inline_data:
+                        # Extract image data
+                        img_data = base64.b64decode(part.inline_data.data)
+                        img_3d = Image.open(io.BytesIO(img_data))
+                        
+                        # Save to bytes
+                        img_bytes = io.BytesIO()
+                        img_3d.save(img_bytes, format='PNG')
+                        img_bytes.seek(0)
+                        
+                        return img_bytes
+    
+    # If no image in response, try using the model's image generation capability
+    # Some models return images differently - check for image data in response
+    if hasattr(response, 'parts'):
+        for part in response.parts:
+            if hasattr(part, 'inline_data') and part.inline_data:
+                img_data = base64.b64decode(part.inline_data.data)
+                img_3d = Image.open(io.BytesIO(img_data))
+                img_bytes = io.BytesIO()
+                img_3d.save(img_bytes, format='PNG')
+                img_bytes.seek(0)
+                return img_bytes
+
+    return None
+
+def _synthesize_fallback(img):
+    """
+    Build a pseudo-3D rendering of the floor plan locally
+    numpy is imported here only to keep it out of startup; imagehash loads it on the first analysis cache miss anyway
+    Returns a BytesIO of PNG data
+    """
+    # Convert to RGB if needed
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    # Create a 3D-like transformation
+    from PIL import ImageFilter
+    import numpy as np
+    
+    width, height = img.size
+    
+    # Enhance contrast (x1.3 around the mean grey level) and brightness (x1.1), matching
+    # ImageEnhance.Contrast followed by ImageEnhance.Brightness. Both are per-value maps,
+    # so they collapse into one 256-entry lookup table and the image stays uint8 throughout
+    mean_grey = int(np.asarray(img.convert('L')).mean() + 0.5)
+    levels = np.arange(256, dtype=np.float32)
+    enhance_lut = np.clip(np.clip((levels - mean_grey) * 1.3 + mean_grey, 0, 255) * 1.1, 0, 255)
+    enhanced = enhance_lut.astype(np.uint8)[np.asarray(img)]
+    
+    # Add sharpness: push each pixel 20% away from its smoothed neighbourhood (ImageEnhance.Sharpness),
+    # computed in int16 fixed point as round((6 * pixel - smoothed) / 5)
+    smoothed = np.asarray(Image.fromarray(enhanced).filter(ImageFilter.SMOOTH), dtype=np.int16)
+    img_3d = (enhanced.astype(np.int16) * 12 - smoothed * 2 + 5) // 10
+    img_3d = np.clip(img_3d, 0, 255).astype(np.uint8)
+    
+    # Create a shadow effect: greyscale mapped onto #404040-#808080 via a lookup table
+    shadow_lut = (0x40 + np.arange(256) * 0x40 // 255).astype(np.uint8)
+    shadow = shadow_lut[np.asarray(Image.fromarray(img_3d).convert('L'))]
+    
+    # Create a new canvas with padding for shadow and dark background
+    padding = 30
+    shadow_offset = 8
+    canvas = np.full((height + padding * 2, width + padding * 2, 3), 0x1a, dtype=np.uint8)
+    
+    # Paste shadow slightly offset to simulate depth, then the main enhanced image
+    canvas[padding + shadow_offset:padding + shadow_offset + height,
+           padding + shadow_offset:padding + shadow_offset + width] = shadow[:, :, None]
+    canvas[padding:padding + height, padding:padding + width] = img_3d
+    
+    # Add a 3D border effect: three one-pixel outlines with a grey gradient
+    for i, level in enumerate((100, 130, 160)):
+        top_left = padding - i - 1
+        bottom = padding + height + i
+        right = padding + width + i
+        canvas[top_left, top_left:right + 1] = level
+        canvas[bottom, top_left:right + 1] = level
+        canvas[top_left:bottom + 1, top_left] = level
+        canvas[top_left:bottom + 1, right] = level
+    
+    # Add corner highlights for 3D effect: 2px white strokes along the top-left corner
+    canvas[padding:padding + 2, padding:padding + 21] = 255
+    canvas[padding:padding + 21, padding:padding + 2] = 255
+    
+    # Save to bytes, converting back to PIL only once
+    img_bytes = io.BytesIO()
+    Image.fromarray(canvas).save(img_bytes, format='PNG')
+    img_bytes.seek(0)
+    
+    return img_bytes
+
+def _analysis_job(img, image_key):
+    """Background task: analyze an uploaded floor plan"""
+    return {'feedback': analyze_floor_plan(img, image_key)}
+
+def _generate_3d_job(img, image_key):
+    """
+    Background task: generate a 3D view from a pending upload
+    The PNG is served from the response cache by /3d/<key>.png rather than inlined
+    """
+    image_url = f"/3d/{image_key}.png"
+    
+    if response_cache.cached_path('3d', VIEW_3D_CACHE_NAMESPACE, image_key, 'png'):
+        return {'image_url': image_url, 'mime_type': 'image/png'}
+    
+    img_bytes, mime_type = generate_3d_view_from_plan(img, image_key)
+    
+    if response_cache.cached_path('3d', VIEW_3D_CACHE_NAMESPACE, image_key, 'png'):
+        return {'image_url': image_url, 'mime_type': mime_type}
+    
+    # Cache write failed - convert to base64 for frontend instead
+    img_base64 = base64.b64encode(img_bytes.read()).decode('utf-8')
+    
+    return {'image_data': img_base64, 'mime_type': mime_type}
+
+def _pending_3d_job(png_bytes, image_key):
+    """Background task: generate a 3D view from an upload held in PENDING_UPLOADS"""
+    # Image.open is lazy, so nothing is decoded if the 3D view is already cached
+    return _generate_3d_job(Image.open(io.BytesIO(png_bytes)), image_key)
+
 @app.route('/')
 def index():
     """Serve the main page"""
@@ -252,12 +359,69 @@ def index():
 
 @app.errorhandler(413)
 def request_entity_too_large(error):
-    """Handle file size limit exceeded"""
+    """Handle file size or multipart limits exceeded"""
+    content_length = request.content_length
+    if content_length is not None and content_length <= MAX_FILE_SIZE:
+        # The body itself was small enough, so UploadRequest's multipart limits rejected it
+        return jsonify({
+            'error': f'Upload form exceeds the limits of {MAX_FORM_PARTS} parts '
+                     f'and {MAX_FORM_FIELD_SIZE // 1024}KB per text field'
+        }), 413
     return jsonify({'error': 'File size exceeds the 16MB limit'}), 413
 
+def _start_analysis(image_bytes, with_3d=False):
+    """
+    Queue analysis of an upload
+    With with_3d the 3D view is queued at the same time so both Gemini calls run concurrently;
+    otherwise the upload is held in memory for a later /generate_3d call
+    """
+    if not image_bytes:
+        return jsonify({'error': 'Uploaded file is empty'}), 400
+    
+    # Image.open only parses the header, so this is a cheap check of the file's real type
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+    except UnidentifiedImageError:
+        img = None
+    if img is None or img.format not in ALLOWED_IMAGE_FORMATS:
+        return jsonify({
+            'error': f'File is not a valid image. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
+        }), 400
+    
+    # Decode and downscale once; both Gemini calls and the 3D fallback share the result
+    image_key = response_cache.image_hash(image_bytes)
+    try:
+        img = _prepare_for_gemini(img)
+    except (OSError, Image.DecompressionBombError) as e:
+        # The header parsed but the pixel data is truncated, corrupt or implausibly large
+        return jsonify({'error': f'Image could not be decoded: {e}'}), 400
+    
+    # Analyze the floor plan in the background
+    task_id = tasks.submit(_analysis_job, img, image_key)
+    
+    if with_3d:
+        return jsonify({
+            'success': True,
+            'task_id': task_id,
+            'task_id_3d': tasks.submit(_generate_3d_job, img, image_key)
+        }), 202
+    
+    # Keep the downscaled image for 3D generation (popped by /generate_3d or expired by the TTL)
+    png_bytes = io.BytesIO()
+    img.save(png_bytes, format='PNG', compress_level=1)
+    temp_id = uuid.uuid4().hex
+    with PENDING_UPLOADS_LOCK:
+        PENDING_UPLOADS[temp_id] = (png_bytes.getvalue(), image_key)
+    
+    return jsonify({
+        'success': True,
+        'task_id': task_id,
+        'temp_filename': temp_id
+    }), 202
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
-    """Handle image upload and analysis"""
+    """Handle multipart image upload and queue analysis; poll /result/<task_id> for feedback"""
     try:
         # Check if file is present
         if 'file' not in request.files:
@@ -275,101 +439,146 @@ def analyze():
                 'error': f'Invalid file type. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
             }), 400
         
-        # Check file size before saving
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)  # Reset file pointer
+        try:
+            return _start_analysis(file.read())
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+            
+    except RequestEntityTooLarge:
+        # Raised while parsing the form (body or part count over the limits); let the 413 handler respond
+        raise
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+def _read_request_body():
+    """
+    Read the raw request body into a single buffer
+    With a Content-Length the body is read straight into a preallocated buffer,
+    avoiding per-chunk allocations and repeated buffer growth
+    """
+    # MAX_CONTENT_LENGTH makes request.stream reject oversize bodies with a 413,
+    # so access it before allocating anything based on the declared length
+    stream = request.stream
+    content_length = request.content_length
+    
+    if not content_length:
+        body = bytearray()
+        while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+            body += chunk
+        return body
+    
+    # A body shorter than its Content-Length is rejected with ClientDisconnected (400): Werkzeug
+    # raises it itself, except on servers that terminate the input stream, where readinto returns 0
+    body = bytearray(content_length)
+    received = 0
+    with memoryview(body) as view:
+        while received < content_length:
+            count = stream.readinto(view[received:])
+            if not count:
+                raise ClientDisconnected()
+            received += count
+    return body
+
+def _handle_raw_upload(with_3d):
+    """Validate a raw image upload (PUT ...?filename=plan.png) and queue its processing"""
+    try:
+        filename = request.args.get('filename', '')
         
-        if file_size > MAX_FILE_SIZE:
+        # Check if file is selected
+        if filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+        
+        # Validate file type
+        if not allowed_file(filename):
             return jsonify({
-                'error': f'File size ({file_size / (1024*1024):.2f}MB) exceeds the 16MB limit'
+                'error': f'Invalid file type. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
             }), 400
         
-        # Save uploaded file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
         try:
-            file.save(filepath)
-            
-            # Verify file was saved and is readable
-            if not os.path.exists(filepath) or os.path.getsize(filepath) == 0:
-                raise Exception('Failed to save file or file is empty')
-            
-            # Analyze the floor plan
-            feedback = analyze_floor_plan(filepath)
-            
-            # Read image as base64 for frontend use
-            with open(filepath, 'rb') as img_file:
-                img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
-            
-            # Store filepath temporarily (will be cleaned up after 3D generation or timeout)
-            # For now, keep the file for 3D generation
-            temp_filename = f"temp_{filename}"
-            temp_filepath = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
-            shutil.copy2(filepath, temp_filepath)
-            
-            return jsonify({
-                'success': True,
-                'feedback': feedback,
-                'image_data': img_base64,
-                'temp_filename': temp_filename
-            })
+            return _start_analysis(_read_request_body(), with_3d=with_3d)
+        except HTTPException:
+            # RequestEntityTooLarge (413) or ClientDisconnected (400); let Flask respond
+            raise
         except Exception as e:
-            # Clean up file on error
-            if os.path.exists(filepath):
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
             return jsonify({'error': str(e)}), 500
             
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+@app.route('/analyze_stream', methods=['PUT'])
+def analyze_stream():
+    """
+    Handle a raw image upload (PUT /analyze_stream?filename=plan.png) and queue analysis
+    The body is read straight from the request stream, skipping multipart parsing and temp-file spooling
+    """
+    return _handle_raw_upload(with_3d=False)
+
+@app.route('/analyze_and_3d', methods=['PUT'])
+def analyze_and_3d():
+    """
+    Handle a raw image upload (PUT /analyze_and_3d?filename=plan.png) and queue both
+    the analysis and the 3D view; poll /result/ with task_id and task_id_3d
+    """
+    return _handle_raw_upload(with_3d=True)
+
 @app.route('/generate_3d', methods=['POST'])
 def generate_3d():
-    """Generate 3D isometric view from floor plan"""
+    """Queue 3D isometric view generation; poll /result/<task_id> for the image"""
     try:
         data = request.get_json()
-        temp_filename = data.get('temp_filename')
+        temp_id = data.get('temp_filename')
         
-        if not temp_filename:
+        if not temp_id:
             return jsonify({'error': 'No image file provided'}), 400
         
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
+        with PENDING_UPLOADS_LOCK:
+            pending = PENDING_UPLOADS.pop(temp_id, None)
         
-        if not os.path.exists(filepath):
-            return jsonify({'error': 'Image file not found'}), 404
+        if pending is None:
+            return jsonify({'error': 'Image not found or expired. Please upload it again.'}), 404
         
-        try:
-            # Generate 3D view
-            img_bytes, mime_type = generate_3d_view_from_plan(filepath)
-            
-            # Convert to base64 for frontend
-            img_base64 = base64.b64encode(img_bytes.read()).decode('utf-8')
-            
-            # Clean up temporary file
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            
-            return jsonify({
-                'success': True,
-                'image_data': img_base64,
-                'mime_type': mime_type
-            })
-        except Exception as e:
-            # Clean up file on error
-            if os.path.exists(filepath):
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
-            return jsonify({'error': str(e)}), 500
+        task_id = tasks.submit(_pending_3d_job, *pending)
+        
+        return jsonify({
+            'success': True,
+            'task_id': task_id
+        }), 202
             
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+@app.route('/3d/<image_key>.png')
+def view_3d_image(image_key):
+    """Serve a generated 3D view from the response cache"""
+    if not re.fullmatch(r'[0-9a-f]{64}', image_key):
+        return jsonify({'error': '3D view not found'}), 404
+    
+    path = response_cache.cached_path('3d', VIEW_3D_CACHE_NAMESPACE, image_key, 'png')
+    if path is None:
+        return jsonify({'error': '3D view not found or expired'}), 404
+    
+    # Keyed by content hash, so clients can revalidate cheaply with the ETag
+    return send_file(os.path.abspath(path), mimetype='image/png', max_age=3600, conditional=True, etag=True)
+
+@app.route('/result/<task_id>')
+def result(task_id):
+    """Report the status of a background task, returning its result once finished"""
+    future = tasks.get(task_id)
+    
+    if future is None:
+        return jsonify({'error': 'Task not found or expired'}), 404
+    
+    if not future.done():
+        return jsonify({'status': 'pending'}), 202
+    
+    try:
+        payload = future.result()
+    except Exception as e:
+        return jsonify({'status': 'failed', 'error': str(e)}), 500
+    
+    return jsonify({'success': True, 'status': 'done', **payload})
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
-
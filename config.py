@@ -1,4 +1,5 @@
 import os
+import hashlib
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -16,14 +17,60 @@ GEMINI_MODEL = 'gemini-2.5-flash'  # Supports vision capabilities
 # For image generation, you may need to use Google's Imagen API separately
 # Trying standard model name - if image generation model exists, update this
 GEMINI_IMAGE_MODEL = 'gemini-2.5-flash'  # Fallback to standard model if image generation model not available
+GEMINI_MAX_IMAGE_SIZE = 1536  # Longest side (px) of images sent to Gemini; larger ones are downscaled
+
+# Prompt sent with every floor plan analysis request
+ANALYSIS_PROMPT = """Analyze this floor plan and provide CRISP, CONCISE bullet-point feedback. Keep each point to ONE line maximum. Be direct and actionable.
+
+Focus on these three areas:
+
+**Accessibility (ADA Compliance):**
+- Door widths (min 32"), clearances, wheelchair routes, ramps, bathroom accessibility
+
+**Space Efficiency:**
+- Room proportions, wasted space, layout optimization, traffic flow, storage
+
+**Best Practices:**
+- Room flow, natural light, privacy, functionality
+
+IMPORTANT:
+- Maximum 3-5 bullet points per category
+- Each bullet = ONE short sentence (10-15 words max)
+- Skip obvious/good features - only mention issues or improvements
+- Use format: "• Issue: brief solution"
+- Be direct, no explanations or context"""
+
+# Prompt sent when generating a 3D isometric view
+ISOMETRIC_PROMPT = """create a 3d isometric model from this floor plan. 3d isometric model kept on a dark surface
+     at a 30 degree angle with studio lighting. studio lighting and soft shadows"""
+
+# Short hashes of the prompts - cache keys include them so prompt edits invalidate old entries
+PROMPT_VERSION = hashlib.sha1(ANALYSIS_PROMPT.encode('utf-8')).hexdigest()[:8]
+ISOMETRIC_PROMPT_VERSION = hashlib.sha1(ISOMETRIC_PROMPT.encode('utf-8')).hexdigest()[:8]
 
 # Upload configuration
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
-UPLOAD_FOLDER = 'uploads'
+ALLOWED_IMAGE_FORMATS = {'PNG', 'JPEG', 'MPO', 'GIF', 'BMP', 'WEBP'}  # PIL format names; MPO is the multi-picture JPEG many phone cameras write
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Bytes read per iteration when streaming a raw upload
+MAX_FORM_FIELD_SIZE = 128 * 1024  # Max size of a non-file multipart field; Werkzeug also checks its 64KB read buffer against this
+MAX_FORM_PARTS = 100  # Max parts in a multipart upload
+PENDING_UPLOADS_MAX = 256  # Uploads held in memory awaiting 3D generation
+PENDING_UPLOAD_TTL = 10 * 60  # Seconds an upload stays available for 3D generation
+
+# Response cache configuration
+CACHE_FOLDER = 'cache'
+CACHE_TTL = 7 * 24 * 60 * 60  # Cached responses older than this (seconds) are ignored
+CACHE_PRUNE_INTERVAL = 60 * 60  # Seconds between sweeps that delete expired cache entries
+CACHE_TMP_MAX_AGE = 10 * 60  # Partial cache writes older than this (seconds) are treated as orphans
+PHASH_MAX_DISTANCE = 6  # Max differing bits, in both pHash and dHash, to treat two images as the same plan
+
+# Background task configuration
+TASK_WORKERS = 8  # Concurrent Gemini calls; these are I/O-bound so more than CPU count is fine
+TASK_RESULT_TTL = 10 * 60  # Seconds to keep results of tasks that are never polled
 
-# Ensure upload directory exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Ensure cache directory exists
+os.makedirs(CACHE_FOLDER, exist_ok=True)
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
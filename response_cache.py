@@ -0,0 +1,218 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from config import CACHE_FOLDER, CACHE_TTL, CACHE_PRUNE_INTERVAL, CACHE_TMP_MAX_AGE, PHASH_MAX_DISTANCE
+
+# Near-duplicate lookups: perceptual hashes persisted in sqlite, mirrored in memory and refreshed on a miss
+PHASH_DB_PATH = os.path.join(CACHE_FOLDER, 'phash.db')
+_phash_lock = threading.Lock()
+_phash_entries = {}  # namespace -> {rowid: (phash, dhash, response, timestamp)}
+_phash_last_rowid = 0  # Highest sqlite rowid merged into _phash_entries
+_phash_local_ids = 0  # Negative keys for entries that could not be persisted
+
+def image_hash(image_bytes):
+    """Return the SHA-256 hex digest used as the cache key for an image"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def _entry_path(kind, namespace, key, ext):
+    """Build the on-disk path for a cache entry"""
+    return os.path.join(CACHE_FOLDER, kind, namespace, f"{key}.{ext}")
+
+def cached_path(kind, namespace, key, ext):
+    """
+    Return the path of the cache entry for key, or None on a miss
+    Entries older than CACHE_TTL are treated as misses
+    """
+    path = _entry_path(kind, namespace, key, ext)
+    try:
+        if time.time() - os.path.getmtime(path) > CACHE_TTL:
+            return None
+    except OSError:
+        return None
+    return path
+
+def load(kind, namespace, key, ext):
+    """Return cached bytes for key, or None on a miss"""
+    path = cached_path(kind, namespace, key, ext)
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as cache_file:
+            return cache_file.read()
+    except OSError:
+        return None
+
+def store(kind, namespace, key, ext, data):
+    """
+    Write data to the cache atomically
+    Writes go to a temporary file first so readers never see a partial entry
+    """
+    path = _entry_path(kind, namespace, key, ext)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as cache_file:
+            cache_file.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # A failed cache write should never fail the request
+        print(f"Failed to write cache entry {path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def perceptual_hashes(img):
+    """
+    Return the 64-bit (phash, dhash) of a PIL image as ints
+    Floor plans are low-entropy line drawings, so distinct plans can collide on pHash alone;
+    the difference hash is checked as well before two images are treated as the same plan
+    """
+    # Imported on first use - imagehash pulls in numpy and scipy
+    import imagehash
+    return int(str(imagehash.phash(img)), 16), int(str(imagehash.dhash(img)), 16)
+
+def _connect():
+    """Open the perceptual hash database, creating the table if needed"""
+    conn = sqlite3.connect(PHASH_DB_PATH, timeout=10, isolation_level=None)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses "
+        "(namespace TEXT, phash TEXT, dhash TEXT, sha TEXT, response TEXT, ts INTEGER)"
+    )
+    return conn
+
+def _load_new_phash_entries():
+    """
+    Merge unexpired rows written since the last load, by this or any other process,
+    into _phash_entries and return them as (namespace, entry) pairs
+    Caller must hold _phash_lock
+    """
+    global _phash_last_rowid
+    try:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                "SELECT rowid, namespace, phash, dhash, response, ts FROM responses "
+                "WHERE rowid > ? AND ts >= ? ORDER BY rowid",
+                (_phash_last_rowid, int(time.time() - CACHE_TTL))
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Failed to load perceptual hash entries: {e}")
+        return []
+    added = []
+    for rowid, namespace, phash, dhash, response, ts in rows:
+        _phash_last_rowid = max(_phash_last_rowid, rowid)
+        entries = _phash_entries.setdefault(namespace, {})
+        if rowid in entries:
+            continue
+        entry = (int(phash, 16), int(dhash, 16), response, ts)
+        entries[rowid] = entry
+        added.append((namespace, entry))
+    return added
+
+def _closest(phash, dhash, entries, cutoff):
+    """Return (distance, response) for the closest entry within PHASH_MAX_DISTANCE, or None"""
+    best = None
+    for candidate_phash, candidate_dhash, response, ts in entries:
+        if ts < cutoff:
+            continue
+        phash_distance = bin(phash ^ candidate_phash).count('1')
+        dhash_distance = bin(dhash ^ candidate_dhash).count('1')
+        if phash_distance > PHASH_MAX_DISTANCE or dhash_distance > PHASH_MAX_DISTANCE:
+            continue
+        distance = phash_distance + dhash_distance
+        if best is None or distance < best[0]:
+            best = (distance, response)
+    return best
+
+def find_similar(namespace, hashes):
+    """
+    Return the cached response for the closest image whose pHash and dHash are both
+    within PHASH_MAX_DISTANCE bits, or None if no near-duplicate has been seen
+    On an in-memory miss, rows other processes have written since are checked too
+    """
+    phash, dhash = hashes
+    cutoff = time.time() - CACHE_TTL
+    with _phash_lock:
+        best = _closest(phash, dhash, _phash_entries.get(namespace, {}).values(), cutoff)
+        if best is None:
+            added = [entry for entry_namespace, entry in _load_new_phash_entries() if entry_namespace == namespace]
+            best = _closest(phash, dhash, added, cutoff)
+    return best[1] if best is not None else None
+
+def remember_similar(namespace, hashes, sha, response):
+    """Record a response so near-duplicates of this image can reuse it"""
+    global _phash_local_ids
+    phash, dhash = hashes
+    ts = int(time.time())
+    with _phash_lock:
+        try:
+            conn = _connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                cursor = conn.execute(
+                    "INSERT INTO responses (namespace, phash, dhash, sha, response, ts) VALUES (?, ?, ?, ?, ?, ?)",
+                    (namespace, f"{phash:016x}", f"{dhash:016x}", sha, response, ts)
+                )
+                conn.execute("COMMIT")
+                key = cursor.lastrowid
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            # The in-memory entry still serves this process
+            print(f"Failed to persist perceptual hash entry: {e}")
+            _phash_local_ids -= 1
+            key = _phash_local_ids
+        # Keyed by rowid so a later refresh does not add the same row twice
+        _phash_entries.setdefault(namespace, {})[key] = (phash, dhash, response, ts)
+
+def prune_expired():
+    """
+    Delete cache files and perceptual hash rows older than CACHE_TTL
+    Also removes temp files left behind by writes interrupted by a crash
+    """
+    cutoff = time.time() - CACHE_TTL
+    tmp_cutoff = time.time() - CACHE_TMP_MAX_AGE
+    for dirpath, dirnames, filenames in os.walk(CACHE_FOLDER):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if path == PHASH_DB_PATH or path.startswith(PHASH_DB_PATH + '-'):
+                continue
+            try:
+                mtime = os.path.getmtime(path)
+                if mtime < cutoff or (filename.endswith('.tmp') and mtime < tmp_cutoff):
+                    os.remove(path)
+            except OSError:
+                pass
+    
+    with _phash_lock:
+        for entries in _phash_entries.values():
+            for key in [key for key, entry in entries.items() if entry[3] < cutoff]:
+                del entries[key]
+        try:
+            conn = _connect()
+            try:
+                conn.execute("DELETE FROM responses WHERE ts < ?", (int(cutoff),))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Failed to prune perceptual hash entries: {e}")
+
+def _janitor_loop():
+    """Run prune_expired every CACHE_PRUNE_INTERVAL seconds"""
+    while True:
+        try:
+            prune_expired()
+        except Exception as e:
+            print(f"Cache cleanup failed: {e}")
+        time.sleep(CACHE_PRUNE_INTERVAL)
+
+def start_janitor():
+    """Start the background thread that removes expired cache entries"""
+    thread = threading.Thread(target=_janitor_loop, name='cache-janitor', daemon=True)
+    thread.start()
+    return thread
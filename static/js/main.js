@@ -22,6 +22,8 @@ document.addEventListener('DOMContentLoaded', function() {
     let tempFilename = null;
     let current3dImageUrl = null;
 
+    const TASK_POLL_INTERVAL_MS = 1000;
+
     // Click to upload
     uploadArea.addEventListener('click', () => {
         fileInput.click();
@@ -102,13 +104,14 @@ document.addEventListener('DOMContentLoaded', function() {
         hideError();
         hideResults();
 
-        const formData = new FormData();
-        formData.append('file', selectedFile);
-
         try {
-            const response = await fetch('/analyze', {
-                method: 'POST',
-                body: formData
+            // Send the raw file as the request body so the server reads it without multipart parsing
+            const response = await fetch(`/analyze_stream?filename=${encodeURIComponent(selectedFile.name)}`, {
+                method: 'PUT',
+                headers: {
+                    'Content-Type': selectedFile.type
+                },
+                body: selectedFile
             });
 
             // Check if response is JSON
@@ -123,21 +126,23 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error(data.error || `Server error: ${response.status}`);
             }
 
-            // Validate response structure
-            if (!data.success || !data.feedback) {
+            if (!data.success || !data.task_id) {
                 throw new Error('Invalid response format from server.');
             }
 
             // Store temp filename for 3D generation
             tempFilename = data.temp_filename;
-            
-            // Update image preview URL if provided
-            if (data.image_data) {
-                imagePreviewUrl = `data:image/png;base64,${data.image_data}`;
+
+            // Wait for the background analysis to finish
+            const result = await waitForTask(data.task_id);
+
+            // Validate response structure
+            if (!result.success || !result.feedback) {
+                throw new Error('Invalid response format from server.');
             }
 
             // Display results
-            displayResults(data.feedback);
+            displayResults(result.feedback);
         } catch (error) {
             // Handle network errors
             if (error.name === 'TypeError' && error.message.includes('fetch')) {
@@ -150,6 +155,30 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    // Poll a background task until it finishes, returning its result
+    async function waitForTask(taskId) {
+        while (true) {
+            const response = await fetch(`/result/${taskId}`);
+
+            let data;
+            try {
+                data = await response.json();
+            } catch (e) {
+                throw new Error('Invalid response from server.');
+            }
+
+            if (!response.ok) {
+                throw new Error(data.error || `Server error: ${response.status}`);
+            }
+
+            if (data.status !== 'pending') {
+                return data;
+            }
+
+            await new Promise(resolve => setTimeout(resolve, TASK_POLL_INTERVAL_MS));
+        }
+    }
+
     function displayResults(feedback) {
         // Reset 3D view
         result3dPreview.style.display = 'none';
@@ -299,12 +328,19 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error(data.error || `Server error: ${response.status}`);
             }
 
-            if (!data.success || !data.image_data) {
+            if (!data.success || !data.task_id) {
+                throw new Error('Invalid response format from server.');
+            }
+
+            // Wait for the background generation to finish
+            const result = await waitForTask(data.task_id);
+
+            if (!result.success || !(result.image_url || result.image_data)) {
                 throw new Error('Invalid response format from server.');
             }
 
-            // Display 3D image
-            current3dImageUrl = `data:${data.mime_type || 'image/png'};base64,${data.image_data}`;
+            // Display 3D image (served as a file; inline base64 only if the server couldn't cache it)
+            current3dImageUrl = result.image_url || `data:${result.mime_type || 'image/png'};base64,${result.image_data}`;
             result3dImage.src = current3dImageUrl;
             result3dPreview.style.display = 'block';
             
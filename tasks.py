@@ -0,0 +1,44 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import TASK_WORKERS, TASK_RESULT_TTL
+
+# Gemini calls are I/O-bound, so a thread pool lets request handlers return immediately
+_executor = ThreadPoolExecutor(max_workers=TASK_WORKERS, thread_name_prefix='gemini')
+
+# Task state lives in this process only: /result/<task_id> must reach the process that accepted
+# the upload, so run a single worker process (e.g. gunicorn -w 1 --threads N), not gunicorn -w N
+_tasks = {}  # task_id -> (future, submitted_at)
+_tasks_lock = threading.Lock()
+
+def submit(fn, *args):
+    """Run fn(*args) on the worker pool and return a task id for polling"""
+    task_id = uuid.uuid4().hex
+    future = _executor.submit(fn, *args)
+    with _tasks_lock:
+        _prune_expired()
+        _tasks[task_id] = (future, time.time())
+    return task_id
+
+def get(task_id):
+    """
+    Return the future for task_id, or None if the id is unknown
+    Finished tasks are forgotten once fetched
+    """
+    with _tasks_lock:
+        entry = _tasks.get(task_id)
+        if entry is None:
+            return None
+        future = entry[0]
+        if future.done():
+            del _tasks[task_id]
+    return future
+
+def _prune_expired():
+    """Drop finished tasks nobody polled for (caller must hold _tasks_lock)"""
+    cutoff = time.time() - TASK_RESULT_TTL
+    expired = [task_id for task_id, (future, submitted_at) in _tasks.items()
+               if future.done() and submitted_at < cutoff]
+    for task_id in expired:
+        del _tasks[task_id]